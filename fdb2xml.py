@@ -3,21 +3,31 @@
 fdb2xml - Generic Firebird .FDB to flat XML.
 
 Usage:
-    python fdb2xml.py <database.fdb> [-o outdir]
+    python fdb2xml.py <database.fdb> [-o outdir] [--fetch-size N] [-j jobs] [--gzip]
+                      [--pretty]
 
 Uses Firebird Embedded (fbembed.dll / fbclient.dll) from runtime/ folder.
 
 Output:
     <name>.xml - Exact flat XML representation of the database
+                 (<name>.xml.gz with --gzip)
 """
 
 import argparse
-import base64
+import binascii
+import collections
 import datetime
 import decimal
+import functools
+import gzip
 import os
+import shutil
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 
 import fdb
 
@@ -26,6 +36,19 @@ import fdb
 # Firebird native type mapping
 # ---------------------------------------------------------------------------
 
+BASIC_TYPES = {
+    7: "SMALLINT",
+    8: "INTEGER",
+    16: "BIGINT",
+    10: "FLOAT",
+    27: "DOUBLE PRECISION",
+    12: "DATE",
+    13: "TIME",
+    35: "TIMESTAMP",
+}
+
+
+@functools.lru_cache(maxsize=256)
 def get_fb_type(field_type, field_sub_type, field_length, field_precision, field_scale,
                 char_length=None):
     field_sub_type = field_sub_type or 0
@@ -35,34 +58,20 @@ def get_fb_type(field_type, field_sub_type, field_length, field_precision, field
     if field_type in (7, 8, 16) and field_sub_type in (1, 2):
         t = "NUMERIC" if field_sub_type == 1 else "DECIMAL"
         return f"{t}({field_precision},{-field_scale})"
-    if field_type == 7:
-        return "SMALLINT"
-    if field_type == 8:
-        return "INTEGER"
-    if field_type == 16:
-        return "BIGINT"
-    if field_type == 10:
-        return "FLOAT"
-    if field_type == 27:
-        return "DOUBLE PRECISION"
-    if field_type == 12:
-        return "DATE"
-    if field_type == 13:
-        return "TIME"
-    if field_type == 35:
-        return "TIMESTAMP"
-    if field_type == 14:
-        n = char_length if char_length else field_length
-        return f"CHAR({n})"
-    if field_type in (37, 40):
-        n = char_length if char_length else field_length
-        return f"VARCHAR({n})"
     if field_type == 261:
         if field_sub_type == 0:
             return "BLOB SUB_TYPE BINARY"
         if field_sub_type == 1:
             return "BLOB SUB_TYPE TEXT"
         return f"BLOB SUB_TYPE {field_sub_type}"
+    if field_type in BASIC_TYPES:
+        return BASIC_TYPES[field_type]
+    if field_type == 14:
+        n = char_length if char_length else field_length
+        return f"CHAR({n})"
+    if field_type in (37, 40):
+        n = char_length if char_length else field_length
+        return f"VARCHAR({n})"
     return f"VARCHAR(255) /* unknown fb type {field_type} */"
 
 
@@ -74,29 +83,80 @@ def safe_str(val):
     if val is None:
         return ""
     if isinstance(val, datetime.datetime):
-        return val.strftime("%Y-%m-%d %H:%M:%S")
+        return val.isoformat(" ", "seconds")
     if isinstance(val, datetime.date):
-        return val.strftime("%Y-%m-%d")
+        return val.isoformat()
     if isinstance(val, datetime.time):
-        return val.strftime("%H:%M:%S")
+        return val.isoformat("seconds")
     if isinstance(val, decimal.Decimal):
         return str(val)
     if isinstance(val, bytes):
         try:
             return val.decode("utf-8").rstrip()
         except UnicodeDecodeError:
-            return base64.b64encode(val).decode("ascii")
+            return binascii.b2a_base64(val, newline=False).decode("ascii")
     if isinstance(val, str):
         return val.rstrip()
     return str(val)
 
 
+# isoformat is implemented in C and much cheaper than strftime for these layouts.
+# Unlike strftime it zero-pads years before 1000 (0999-01-01, not 999-01-01).
+def format_timestamp(val):
+    return val.isoformat(" ", "seconds")
+
+
+format_date = datetime.date.isoformat
+
+
+def format_time(val):
+    return val.isoformat("seconds")
+
+
+def format_text(val):
+    return val.rstrip()
+
+
+NUMBER_TYPES = ("SMALLINT", "INTEGER", "BIGINT", "FLOAT", "DOUBLE PRECISION")
+
+
+def make_formatter(fb_type):
+    """Pick the formatter for non-NULL, non-bytes values of a column once, from its type."""
+    if fb_type == "TIMESTAMP":
+        return format_timestamp
+    if fb_type == "DATE":
+        return format_date
+    if fb_type == "TIME":
+        return format_time
+    if fb_type in NUMBER_TYPES or fb_type.startswith(("NUMERIC(", "DECIMAL(")):
+        return str
+    if fb_type == "BLOB SUB_TYPE TEXT" or (fb_type.startswith(("CHAR(", "VARCHAR("))
+                                           and "unknown" not in fb_type):
+        return format_text
+    return safe_str
+
+
 # ---------------------------------------------------------------------------
 # Database metadata
 # ---------------------------------------------------------------------------
 
-def get_user_tables(conn):
-    cur = conn.cursor()
+META_FETCH_SIZE = 1000
+DATA_FETCH_SIZE = 10000
+
+
+def iter_rows(cur, size=META_FETCH_SIZE):
+    while True:
+        chunk = cur.fetchmany(size)
+        if not chunk:
+            return
+        yield from chunk
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def get_user_tables(cur):
     cur.execute("""
         SELECT TRIM(RDB$RELATION_NAME)
         FROM RDB$RELATIONS
@@ -104,15 +164,14 @@ def get_user_tables(conn):
           AND RDB$VIEW_BLR IS NULL
         ORDER BY RDB$RELATION_NAME
     """)
-    tables = [row[0] for row in cur.fetchall()]
-    cur.close()
+    tables = [row[0] for row in iter_rows(cur)]
     return tables
 
 
-def get_table_columns(conn, table_name):
-    cur = conn.cursor()
+def get_all_table_columns(cur):
     cur.execute("""
         SELECT
+            TRIM(rf.RDB$RELATION_NAME),
             TRIM(rf.RDB$FIELD_NAME),
             f.RDB$FIELD_TYPE,
             f.RDB$FIELD_SUB_TYPE,
@@ -123,39 +182,39 @@ def get_table_columns(conn, table_name):
             f.RDB$CHARACTER_LENGTH
         FROM RDB$RELATION_FIELDS rf
         JOIN RDB$FIELDS f ON rf.RDB$FIELD_SOURCE = f.RDB$FIELD_NAME
-        WHERE rf.RDB$RELATION_NAME = ?
-        ORDER BY rf.RDB$FIELD_POSITION
-    """, (table_name,))
-    columns = []
-    for name, ftype, fsub, flen, fprec, fscale, null_flag, char_len in cur.fetchall():
-        columns.append({
+        JOIN RDB$RELATIONS r ON rf.RDB$RELATION_NAME = r.RDB$RELATION_NAME
+        WHERE r.RDB$SYSTEM_FLAG = 0
+          AND r.RDB$VIEW_BLR IS NULL
+        ORDER BY rf.RDB$RELATION_NAME, rf.RDB$FIELD_POSITION
+    """)
+    columns = {}
+    for table, name, ftype, fsub, flen, fprec, fscale, null_flag, char_len in iter_rows(cur):
+        columns.setdefault(table, []).append({
             "name": name,
             "fb_type": get_fb_type(ftype, fsub, flen, fprec, fscale, char_len),
             "not_null": null_flag is not None and null_flag == 1,
         })
-    cur.close()
     return columns
 
 
-def get_primary_key(conn, table_name):
-    cur = conn.cursor()
+def get_all_primary_keys(cur):
     cur.execute("""
-        SELECT TRIM(sg.RDB$FIELD_NAME)
+        SELECT TRIM(rc.RDB$RELATION_NAME), TRIM(sg.RDB$FIELD_NAME)
         FROM RDB$RELATION_CONSTRAINTS rc
         JOIN RDB$INDEX_SEGMENTS sg ON rc.RDB$INDEX_NAME = sg.RDB$INDEX_NAME
-        WHERE rc.RDB$RELATION_NAME = ?
-          AND rc.RDB$CONSTRAINT_TYPE = 'PRIMARY KEY'
-        ORDER BY sg.RDB$FIELD_POSITION
-    """, (table_name,))
-    pk = [row[0] for row in cur.fetchall()]
-    cur.close()
-    return pk
+        WHERE rc.RDB$CONSTRAINT_TYPE = 'PRIMARY KEY'
+        ORDER BY rc.RDB$RELATION_NAME, sg.RDB$FIELD_POSITION
+    """)
+    pks = {}
+    for table, column in iter_rows(cur):
+        pks.setdefault(table, []).append(column)
+    return pks
 
 
-def get_foreign_keys(conn, table_name):
-    cur = conn.cursor()
+def get_all_foreign_keys(cur):
     cur.execute("""
         SELECT
+            TRIM(rc.RDB$RELATION_NAME),
             TRIM(rc.RDB$CONSTRAINT_NAME),
             TRIM(sg.RDB$FIELD_NAME),
             TRIM(rc2.RDB$RELATION_NAME),
@@ -165,31 +224,36 @@ def get_foreign_keys(conn, table_name):
         JOIN RDB$REF_CONSTRAINTS ref ON rc.RDB$CONSTRAINT_NAME = ref.RDB$CONSTRAINT_NAME
         JOIN RDB$RELATION_CONSTRAINTS rc2 ON ref.RDB$CONST_NAME_UQ = rc2.RDB$CONSTRAINT_NAME
         JOIN RDB$INDEX_SEGMENTS sg2 ON rc2.RDB$INDEX_NAME = sg2.RDB$INDEX_NAME
-        WHERE rc.RDB$RELATION_NAME = ?
-          AND rc.RDB$CONSTRAINT_TYPE = 'FOREIGN KEY'
-    """, (table_name,))
-    fks = [{"name": r[0], "column": r[1], "ref_table": r[2], "ref_column": r[3]}
-           for r in cur.fetchall()]
-    cur.close()
+        WHERE rc.RDB$CONSTRAINT_TYPE = 'FOREIGN KEY'
+        ORDER BY rc.RDB$RELATION_NAME, rc.RDB$CONSTRAINT_NAME
+    """)
+    fks = {}
+    for table, name, column, ref_table, ref_column in iter_rows(cur):
+        fks.setdefault(table, []).append(
+            {"name": name, "column": column, "ref_table": ref_table, "ref_column": ref_column})
     return fks
 
 
-def get_generators(conn):
-    cur = conn.cursor()
+GEN_ID_BATCH = 200
+
+
+def get_generators(cur):
     cur.execute("""
         SELECT TRIM(RDB$GENERATOR_NAME)
         FROM RDB$GENERATORS
         WHERE RDB$SYSTEM_FLAG = 0
         ORDER BY RDB$GENERATOR_NAME
     """)
+    names = [row[0] for row in iter_rows(cur)]
+
+    # One GEN_ID probe per generator, batched to stay well under the statement size limit
     generators = []
-    for (name,) in cur.fetchall():
-        cur2 = conn.cursor()
-        cur2.execute(f'SELECT GEN_ID("{name}", 0) FROM RDB$DATABASE')
-        val = cur2.fetchone()[0]
-        cur2.close()
-        generators.append({"name": name, "value": val})
-    cur.close()
+    for i in range(0, len(names), GEN_ID_BATCH):
+        batch = names[i:i + GEN_ID_BATCH]
+        probes = ", ".join(f"GEN_ID({quote_ident(name)}, 0)" for name in batch)
+        cur.execute(f"SELECT {probes} FROM RDB$DATABASE")
+        values = cur.fetchone()
+        generators.extend({"name": name, "value": val} for name, val in zip(batch, values))
     return generators
 
 
@@ -197,7 +261,7 @@ def get_generators(conn):
 # Embedded connection
 # ---------------------------------------------------------------------------
 
-def connect_embedded(fdb_path):
+def connect_embedded(fdb_path, verbose=True):
     fdb_path = os.path.abspath(fdb_path)
     if getattr(sys, 'frozen', False):
         exe_dir = os.path.dirname(os.path.abspath(sys.executable))
@@ -221,13 +285,17 @@ def connect_embedded(fdb_path):
         for dll in ("fbembed.dll", "fbclient.dll"):
             path = os.path.join(d, dll)
             if os.path.exists(path):
-                print(f"  Trying: {path}")
+                if verbose:
+                    print(f"  Trying: {path}")
                 try:
                     return fdb.connect(
                         database=fdb_path,
                         user="sysdba",
                         password="masterkey",
                         fb_library_name=path,
+                        # One snapshot per connection keeps each table's
+                        # COUNT(*) consistent with the rows then selected
+                        isolation_level=fdb.ISOLATION_LEVEL_SNAPSHOT,
                     )
                 except Exception as e:
                     print(f"    Failed: {e}")
@@ -238,83 +306,212 @@ def connect_embedded(fdb_path):
 
 
 # ---------------------------------------------------------------------------
-# Read all data
+# XML generation
 # ---------------------------------------------------------------------------
 
-def read_all_tables(conn):
-    tables = get_user_tables(conn)
-    print(f"  {len(tables)} tables: {', '.join(tables)}")
-
-    data = {}
-    for table in tables:
+WRITE_BUFFER = 1 << 20
+INDENT = "  "
+
+
+ATTR_ENTITIES = {'"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"}
+
+
+def quote_attr(value):
+    # Same escaping and double quotes as ElementTree, so both halves of the file agree
+    return f'"{escape(value, ATTR_ENTITIES)}"'
+
+
+def bytes_col(tag, close, empty_col, val):
+    try:
+        text = val.decode("utf-8").rstrip()
+    except UnicodeDecodeError:
+        text = binascii.b2a_base64(val, newline=False).decode("ascii")
+        return f'{tag} enc="base64">{text}{close}'
+    return f"{tag}>{escape(text)}{close}" if text else empty_col
+
+
+def render_rows(cur, columns, fetch_size=DATA_FETCH_SIZE, pretty=False):
+    """Yield (serialized <row> elements, row count) for each fetch_size chunk of cur.
+
+    Rows are flat, so they are assembled as text instead of going through
+    ET; the start tag of every column is built once per table. Each row is
+    written on a single line unless pretty is set.
+    """
+    pad = INDENT if pretty else ""
+    nl = "\n" if pretty else ""
+    row_start = f"{pad * 3}<row>{nl}"
+    row_end = f"{pad * 3}</row>\n"
+    close = f"</col>{nl}"
+    col_tpl = []
+    for col in columns:
+        tag = f'{pad * 4}<col name={quote_attr(col["name"])} type={quote_attr(col["fb_type"])}'
+        col_tpl.append((tag, f'{tag} null="true" />{nl}', f"{tag} />{nl}",
+                        make_formatter(col["fb_type"])))
+    while True:
+        chunk = cur.fetchmany(fetch_size)
+        if not chunk:
+            return
+        parts = []
+        for raw in chunk:
+            parts.append(row_start)
+            for (tag, null_col, empty_col, fmt), val in zip(col_tpl, raw):
+                if val is None:
+                    parts.append(null_col)
+                elif isinstance(val, bytes):
+                    parts.append(bytes_col(tag, close, empty_col, val))
+                else:
+                    text = escape(fmt(val))
+                    parts.append(f"{tag}>{text}{close}" if text else empty_col)
+            parts.append(row_end)
+        yield "".join(parts).encode("utf-8", "xmlcharrefreplace"), len(chunk)
+
+
+def select_rows_sql(table_name, columns):
+    col_list = ", ".join(quote_ident(col["name"]) for col in columns)
+    return f"SELECT {col_list} FROM {quote_ident(table_name)}"
+
+
+def table_start(table_name, count, pretty=False):
+    pad = INDENT * 2 if pretty else ""
+    tag = f"{pad}<table name={quote_attr(table_name)} count=\"{count}\""
+    return f"{tag}>\n".encode("utf-8") if count else f"{tag} />\n".encode("utf-8")
+
+
+def table_end(pretty=False):
+    pad = INDENT * 2 if pretty else ""
+    return f"{pad}</table>\n".encode("utf-8")
+
+
+def write_table(cur, table_name, columns, out, fetch_size=DATA_FETCH_SIZE, pretty=False,
+                stop=None):
+    """Stream the <table> element of table_name to out and return its row count.
+
+    The count attribute comes from COUNT(*) in the same snapshot as the row
+    SELECT, which costs a database scan but no second pass over the output.
+    When the stop event is set the export is abandoned at the next chunk.
+    """
+    cur.execute(f"SELECT COUNT(*) FROM {quote_ident(table_name)}")
+    count = cur.fetchone()[0]
+    out.write(table_start(table_name, count, pretty))
+    if count:
+        # fdb returns a BlobReader instead of the value for BLOBs over 64 KB
+        # by default; the formatters expect materialized str/bytes values.
+        cur.set_stream_blob_treshold(-1)
+        cur.execute(select_rows_sql(table_name, columns))
+        for block, _ in render_rows(cur, columns, fetch_size, pretty):
+            if stop is not None and stop.is_set():
+                raise RuntimeError(f"export of {table_name} cancelled")
+            out.write(block)
+        out.write(table_end(pretty))
+    return count
+
+
+def open_output(path, compress=False):
+    if compress:
+        return gzip.open(path, "wb", compresslevel=1)
+    return open(path, "wb", buffering=WRITE_BUFFER)
+
+
+def render_table(fdb_path, table_name, columns, tmp_dir, fetch_size, pretty=False,
+                 compress=False, stop=None):
+    """Render the <table> element of one table into a file in tmp_dir on a connection of its own.
+
+    With compress the file is a complete gzip member, so it can be copied
+    byte for byte into the .gz output. Returns (file path, row count).
+    """
+    conn = connect_embedded(fdb_path, verbose=False)
+    fd, part_path = tempfile.mkstemp(dir=tmp_dir)
+    os.close(fd)
+    try:
         cur = conn.cursor()
-        cur.execute(f'SELECT * FROM "{table}"')
-        col_names = [desc[0] for desc in cur.description]
-        rows = []
-        for raw in cur.fetchall():
-            row = {}
-            for i, col in enumerate(col_names):
-                val = raw[i]
-                if isinstance(val, str):
-                    val = val.rstrip()
-                row[col] = val
-            rows.append(row)
+        with open_output(part_path, compress) as part:
+            count = write_table(cur, table_name, columns, part, fetch_size, pretty, stop)
         cur.close()
-        data[table] = rows
-        print(f"    {table}: {len(rows)} rows")
-
-    return data
-
-
-# ---------------------------------------------------------------------------
-# XML generation
-# ---------------------------------------------------------------------------
-
-def xml_col(row_el, name, fb_type, val):
-    attrs = {"name": name, "type": fb_type}
-
-    if val is None:
-        attrs["null"] = "true"
-        ET.SubElement(row_el, "col", **attrs)
-        return
-
-    if isinstance(val, bytes):
-        try:
-            text = val.decode("utf-8").rstrip()
-        except UnicodeDecodeError:
-            attrs["enc"] = "base64"
-            text = base64.b64encode(val).decode("ascii")
-        col_el = ET.SubElement(row_el, "col", **attrs)
-        col_el.text = text
-        return
-
-    col_el = ET.SubElement(row_el, "col", **attrs)
-    col_el.text = safe_str(val)
-
-
-def generate_xml(conn, data, fdb_path, output_path):
+    finally:
+        conn.close()
+    return part_path, count
+
+
+def write_parallel(fdb_path, tables, col_meta, output_path, head, tail, fetch_size, jobs,
+                   compress=False, pretty=False):
+    """Write the document with tables rendered concurrently; return the data element count.
+
+    Each worker renders one table into a part file on its own attachment;
+    the parts are copied into output_path in table order.
+    """
+    total = 0
+    with open(output_path, "wb", buffering=WRITE_BUFFER) as f:
+        # With compress the output is a series of gzip members: the head
+        # (declaration, envelope, schema, <data>), one per table part, then
+        # the tail. Parts are copied in without being inflated on disk.
+        def emit(data):
+            f.write(gzip.compress(data, compresslevel=1) if compress else data)
+
+        emit(head)
+        # Only about `jobs` tables are submitted ahead of the writer so
+        # finished parts do not pile up on disk.
+        stop = threading.Event()
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output_path)) as tmp_dir, \
+                ThreadPoolExecutor(max_workers=jobs) as pool:
+            def submit(table_name):
+                return pool.submit(render_table, fdb_path, table_name, col_meta[table_name],
+                                   tmp_dir, fetch_size, pretty, compress, stop)
+
+            window = collections.deque((t, submit(t)) for t in tables[:jobs])
+            queued = iter(tables[jobs:])
+            try:
+                while window:
+                    table_name, future = window.popleft()
+                    part_path, count = future.result()
+                    next_table = next(queued, None)
+                    if next_table is not None:
+                        window.append((next_table, submit(next_table)))
+
+                    print(f"    {table_name}: {count} rows")
+                    total += 1 + count * (len(col_meta[table_name]) + 1)
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, f, WRITE_BUFFER)
+                    os.remove(part_path)
+            except BaseException:
+                # Leaving the pool waits for running workers; have them stop at
+                # their next fetch chunk instead of finishing their tables.
+                stop.set()
+                raise
+        emit(tail)
+    return total
+
+
+def generate_xml(conn, fdb_path, output_path, fetch_size=DATA_FETCH_SIZE, jobs=1,
+                 compress=False, pretty=False):
+    pad = INDENT if pretty else ""
     now = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
     source = os.path.basename(fdb_path)
 
-    col_meta = {}
-    for table_name in data:
-        col_meta[table_name] = get_table_columns(conn, table_name)
+    # All metadata queries run on one cursor, closed once the schema is built
+    meta_cur = conn.cursor()
+    tables = get_user_tables(meta_cur)
+    print(f"  {len(tables)} tables: {', '.join(tables)}")
 
-    root = ET.Element("database", source=source, exported=now)
+    col_meta = get_all_table_columns(meta_cur)
+    all_pks = get_all_primary_keys(meta_cur)
+    all_fks = get_all_foreign_keys(meta_cur)
 
     # Schema: generators, tables with columns, PKs, FKs
-    schema_el = ET.SubElement(root, "schema")
+    schema_el = ET.Element("schema")
+    total = 1
 
-    generators = get_generators(conn)
+    generators = get_generators(meta_cur)
+    meta_cur.close()
     if generators:
         gens_el = ET.SubElement(schema_el, "generators")
         for gen in generators:
             ET.SubElement(gens_el, "generator", name=gen["name"], value=str(gen["value"]))
+        total += 1 + len(generators)
 
-    for table_name in data:
+    for table_name in tables:
         columns = col_meta[table_name]
-        pk_cols = get_primary_key(conn, table_name)
-        fks = get_foreign_keys(conn, table_name)
+        pk_cols = all_pks.get(table_name, [])
+        fks = all_fks.get(table_name, [])
 
         table_schema = ET.SubElement(schema_el, "table", name=table_name)
 
@@ -324,7 +521,7 @@ def generate_xml(conn, data, fdb_path, output_path):
                 attrs["notnull"] = "true"
             if col["name"] in pk_cols:
                 attrs["pk"] = "true"
-            ET.SubElement(table_schema, "column", **attrs)
+            ET.SubElement(table_schema, "column", attrs)
 
         for fk in fks:
             ET.SubElement(table_schema, "fk",
@@ -332,23 +529,47 @@ def generate_xml(conn, data, fdb_path, output_path):
                           column=fk["column"],
                           references=f'{fk["ref_table"]}({fk["ref_column"]})')
 
-    # Data
-    data_el = ET.SubElement(root, "data")
+        total += 1 + len(columns) + len(fks)
+
+    # Without --pretty this only breaks lines; the schema is small either way
+    ET.indent(schema_el, space=pad, level=1)
+
+    head = b"".join([
+        b"<?xml version='1.0' encoding='UTF-8'?>\n",
+        f"<database source={quote_attr(source)} exported={quote_attr(now)}>\n{pad}"
+        .encode("utf-8"),
+        ET.tostring(schema_el, encoding="utf-8"),
+        f"\n{pad}<data>\n".encode("utf-8"),
+    ])
+    tail = f"{pad}</data>\n</database>\n".encode("utf-8")
+    total += 1
+
+    # The output is built under a temporary name and only renamed into place
+    # once complete, so a failed export never leaves a truncated file behind.
+    partial_path = output_path + ".partial"
+    try:
+        if jobs > 1:
+            total += write_parallel(fdb_path, tables, col_meta, partial_path, head, tail,
+                                    fetch_size, jobs, compress, pretty)
+        else:
+            # The envelope is written by hand so that data rows can be streamed
+            # from the cursor to disk: at most one fetch chunk is held in memory.
+            with open_output(partial_path, compress) as f:
+                f.write(head)
+                cur = conn.cursor()
+                for table_name in tables:
+                    columns = col_meta[table_name]
+                    count = write_table(cur, table_name, columns, f, fetch_size, pretty)
+                    print(f"    {table_name}: {count} rows")
+                    total += 1 + count * (len(columns) + 1)
+                cur.close()
+                f.write(tail)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
 
-    for table_name, rows in data.items():
-        columns = col_meta[table_name]
-        table_el = ET.SubElement(data_el, "table", name=table_name, count=str(len(rows)))
-        for row in rows:
-            row_el = ET.SubElement(table_el, "row")
-            for col in columns:
-                xml_col(row_el, col["name"], col["fb_type"], row.get(col["name"]))
-
-    tree = ET.ElementTree(root)
-    ET.indent(tree, space="  ")
-    with open(output_path, "wb") as f:
-        tree.write(f, encoding="UTF-8", xml_declaration=True)
-
-    total = sum(1 for _ in root.iter()) - 1
     print(f"  {total} elements -> {output_path}")
 
 
@@ -356,10 +577,26 @@ def generate_xml(conn, data, fdb_path, output_path):
 # Main
 # ---------------------------------------------------------------------------
 
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generic Firebird .FDB to flat XML")
     parser.add_argument("fdb_path", help="Path to the .FDB file")
     parser.add_argument("-o", "--outdir", default=None, help="Output directory (default: same as FDB)")
+    parser.add_argument("--fetch-size", type=positive_int, default=DATA_FETCH_SIZE,
+                        help=f"Rows rendered and written per block (default: {DATA_FETCH_SIZE})")
+    parser.add_argument("-j", "--jobs", type=positive_int, default=1,
+                        help="Tables exported in parallel, each on its own connection (default: 1)")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Write gzip-compressed <name>.xml.gz (with --jobs > 1 the file "
+                             "is several concatenated gzip members, one per table)")
+    parser.add_argument("--pretty", action="store_true",
+                        help="Indent the XML (default: one data row per line)")
 
     args = parser.parse_args()
 
@@ -377,6 +614,8 @@ def main():
         outdir = os.path.dirname(fdb_path)
 
     xml_path = os.path.join(outdir, f"{base_name}.xml")
+    if args.gzip:
+        xml_path += ".gz"
 
     print(f"fdb2xml - Firebird -> XML")
     print(f"  Input: {fdb_path}")
@@ -387,12 +626,8 @@ def main():
     conn = connect_embedded(fdb_path)
     print("Connected.\n")
 
-    print("Reading tables...")
-    data = read_all_tables(conn)
-    print()
-
     print("Generating XML...")
-    generate_xml(conn, data, fdb_path, xml_path)
+    generate_xml(conn, fdb_path, xml_path, args.fetch_size, args.jobs, args.gzip, args.pretty)
     print()
 
     conn.close()